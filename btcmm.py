@@ -50,7 +50,7 @@ if __name__ == "__main__":
 
     loop = asyncio.get_event_loop()
     try:
-        loop.run_until_complete(asyncio.wait([strategy.start()]))
+        loop.run_until_complete(strategy.start())
     except (KeyboardInterrupt, SystemExit):
-        loop.run_until_complete(asyncio.wait([strategy.cancel_order_all()]))
+        loop.run_until_complete(strategy.cancel_order_all())
     listener.stop()
@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 import asyncio
+import heapq
 from .streaming import Streaming
 from .utils import stop_watch
 from .cctypes import type_converter
@@ -11,8 +12,11 @@ class Board:
         self.pair = pair
         self.temp_bids = {}
         self.temp_asks = {}
-        self.bids = []
-        self.asks = []
+        self._bids = []
+        self._asks = []
+        # 最良気配用ヒープ（買いは価格を負にして格納、無効な価格は参照時に除去）
+        self._bid_heap = []
+        self._ask_heap = []
         self._updated = False
         self._needs_sort = False
         self.cond = asyncio.Condition()
@@ -23,17 +27,40 @@ class Board:
     def _create(self, board):
         self.temp_bids = {b[0]:b[1] for b in board['bids']}
         self.temp_asks = {b[0]:b[1] for b in board['asks']}
-        self.bids = [{'price':k,'size':v} for k,v in self.temp_bids.items()]
-        self.asks = [{'price':k,'size':v} for k,v in self.temp_asks.items()]
+        self._bids = [{'price':k,'size':v} for k,v in self.temp_bids.items()]
+        self._asks = [{'price':k,'size':v} for k,v in self.temp_asks.items()]
+        self._rebuild_heaps()
+
+    def _rebuild_heaps(self):
+        self._bid_heap = [-k for k,v in self.temp_bids.items() if v>0]
+        self._ask_heap = [k for k,v in self.temp_asks.items() if v>0]
+        heapq.heapify(self._bid_heap)
+        heapq.heapify(self._ask_heap)
 
     def _update(self, board):
-        self.temp_bids.update({b[0]:b[1] for b in board['bids']})
-        self.temp_asks.update({b[0]:b[1] for b in board['asks']})
+        # サイズ0の価格は板から削除し、ヒープには新しく現れた価格だけ追加
+        for price,size in board['bids']:
+            if size>0:
+                if self.temp_bids.get(price,0)<=0:
+                    heapq.heappush(self._bid_heap,-price)
+                self.temp_bids[price] = size
+            else:
+                self.temp_bids.pop(price,None)
+        for price,size in board['asks']:
+            if size>0:
+                if self.temp_asks.get(price,0)<=0:
+                    heapq.heappush(self._ask_heap,price)
+                self.temp_asks[price] = size
+            else:
+                self.temp_asks.pop(price,None)
+        # 無効な価格が溜まりすぎたら作り直す
+        if len(self._bid_heap)+len(self._ask_heap) > 2*(len(self.temp_bids)+len(self.temp_asks))+64:
+            self._rebuild_heaps()
 
     def sync(self, board):
         self._create(board)
         self._updated = True
-        self._needs_sort = False
+        self._needs_sort = True
 
     async def attach(self, streaming):
         await streaming.subscribe_channel(self.pair+'-orderbook',self._orderbook)
@@ -50,9 +77,29 @@ class Board:
             self._needs_sort = False
             self.temp_bids = {k:v for k,v in self.temp_bids.items() if v>0}
             self.temp_asks = {k:v for k,v in self.temp_asks.items() if v>0}
-            self.bids = [{'price':k,'size':v} for k,v in sorted(self.temp_bids.items(),reverse=True)]
-            self.asks = [{'price':k,'size':v} for k,v in sorted(self.temp_asks.items())]
-        return self.bids, self.asks
+            self._bids = [{'price':k,'size':v} for k,v in sorted(self.temp_bids.items(),reverse=True)]
+            self._asks = [{'price':k,'size':v} for k,v in sorted(self.temp_asks.items())]
+        return self._bids, self._asks
+
+    @property
+    def bids(self):
+        return self.sort()[0]
+
+    @property
+    def asks(self):
+        return self.sort()[1]
+
+    def best_bid(self):
+        heap, book = self._bid_heap, self.temp_bids
+        while heap and book.get(-heap[0],0)<=0:
+            heapq.heappop(heap)
+        return -heap[0] if heap else None
+
+    def best_ask(self):
+        heap, book = self._ask_heap, self.temp_asks
+        while heap and book.get(heap[0],0)<=0:
+            heapq.heappop(heap)
+        return heap[0] if heap else None
 
     async def wait(self):
         async with self.cond:
@@ -92,6 +139,6 @@ if __name__ == "__main__":
                 except Exception as e:
                     print(e)
 
-        await asyncio.wait([streaming.start(),poll()])
+        await asyncio.gather(streaming.start(),poll())
 
-    asyncio.get_event_loop().run_until_complete(asyncio.wait([main()]))
+    asyncio.get_event_loop().run_until_complete(main())
@@ -37,6 +37,12 @@ class Exchange:
         self.private_api_enabled = len(apiKey) and len(secret)
         self.api = CCAPI(apiKey, secret)
         self.logger = logging.getLogger(__name__)
+        # 公開情報・残高のキャッシュ有効期間（秒）
+        self.ticker_ttl = 5
+        self.balance_ttl = 5
+        self.orderbooks_ttl = 0.25
+        self._cache = {}
+        self._inflight = {}
 
     def _get_data(self, res, default, errfrom, subfield=None):
         success = res.get('success',0)
@@ -52,14 +58,38 @@ class Exchange:
                 raise InsufficientFunds(f'{error} in {errfrom}')
             raise ExchangeError(f'{error} in {errfrom}')
 
-    async def ticker(self, pair):
+    async def _fetch_cached(self, key, ttl, fetch):
+        value = await fetch()
+        self._cache[key] = (asyncio.get_running_loop().time() + ttl, value)
+        return value
+
+    async def _cached(self, key, ttl, fetch):
+        # 短時間内の再取得はキャッシュを返す
+        hit = self._cache.get(key)
+        if hit is not None and hit[0] > asyncio.get_running_loop().time():
+            return hit[1]
+        # 同時に要求された場合は1回のリクエストを共有
+        fut = self._inflight.get(key)
+        if fut is None:
+            fut = asyncio.ensure_future(self._fetch_cached(key, ttl, fetch))
+            self._inflight[key] = fut
+            fut.add_done_callback(lambda f: self._inflight.pop(key, None))
+        return await asyncio.shield(fut)
+
+    async def _ticker(self, pair):
         res = await self.api.ticker(pair=pair)
         return type_converter(res)
 
-    async def orderbooks(self, pair):
+    async def ticker(self, pair):
+        return await self._cached(('ticker', pair), self.ticker_ttl, lambda: self._ticker(pair))
+
+    async def _orderbooks(self, pair):
         res = await self.api.orderbooks(pair=pair)
         return type_converter(res)
 
+    async def orderbooks(self, pair):
+        return await self._cached(('orderbooks', pair), self.orderbooks_ttl, lambda: self._orderbooks(pair))
+
     async def order(self, pair, side, amount, rate, stop_loss_rate=None):
         spec = Exchange.ProductSpecs[pair]
         amount = spec.round_amount(amount)
@@ -116,10 +146,14 @@ class Exchange:
             t['amount'] = abs(t['funds'][base])
         return trades
 
-    async def balance(self):
+    async def _balance(self):
         res = await self.api.balance()
         return self._get_data(res, {}, 'balance')
 
+    async def balance(self):
+        # 呼び出し側で書き換えられてもキャッシュに影響しないようコピーを返す
+        return dict(await self._cached(('balance',), self.balance_ttl, self._balance))
+
 if __name__ == '__main__':
     from pprint import pprint as pp
 
@@ -67,7 +67,7 @@ class Inventory:
                 self.position_size = 0
                 self.position_pnl = 0
 
-    OPEN_STATUS = ['open']
+    OPEN_STATUS = frozenset(['open'])
 
     def __init__(self, spec):
         self.logger = logging.getLogger(__name__)
@@ -89,10 +89,12 @@ class Inventory:
         return self.order_for_myid[myid]
 
     def get_active_orders(self):
-        return [o for o in self.order_for_myid.values() if o['status'] in Inventory.OPEN_STATUS]
+        open_status = Inventory.OPEN_STATUS
+        return [o for o in self.order_for_myid.values() if o['status'] in open_status]
 
     def get_nonactive_orders(self):
-        my_orders = {o['id']:o for o in self.order_for_myid.values() if o['status'] in Inventory.OPEN_STATUS}
+        open_status = Inventory.OPEN_STATUS
+        my_orders = {o['id'] for o in self.order_for_myid.values() if o['status'] in open_status}
         return [o for o in list(self.active_orders.values())+list(self.nonactive_orders.values()) if o['id'] not in my_orders]
 
     def on_execute(self, o, tr):
@@ -118,8 +120,7 @@ class Inventory:
                 self.position.netprofit))
 
     async def start(self):
-        await asyncio.wait([
-            self.remove_nonactive_orders()])
+        await self.remove_nonactive_orders()
 
     async def remove_nonactive_orders(self):
         while True:
@@ -128,8 +129,9 @@ class Inventory:
                 await asyncio.sleep(300)
                 # ノンアクティブオーダー削除
                 self.logger.info('Remove Nonactive Orders active {0} nonactive {1}'.format(len(self.active_orders),len(self.nonactive_orders)))
-                active_orders = {k:v for k,v in self.active_orders.items() if v['status'] in Inventory.OPEN_STATUS}
-                nonactive_orders = {k:v for k,v in self.active_orders.items() if v['status'] not in Inventory.OPEN_STATUS}
+                open_status = Inventory.OPEN_STATUS
+                active_orders = {k:v for k,v in self.active_orders.items() if v['status'] in open_status}
+                nonactive_orders = {k:v for k,v in self.active_orders.items() if v['status'] not in open_status}
                 self.active_orders = active_orders
                 self.nonactive_orders = nonactive_orders
             except Exception as e:
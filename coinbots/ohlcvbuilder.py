@@ -36,21 +36,38 @@ class OHLCVBuilder:
         return rich_ohlcv
 
     def make_ohlcv(self, executions):
-        price = [e['rate'] for e in executions]
-        buy = [e for e in executions if e['order_type'] == 'buy']
-        sell = [e for e in executions if e['order_type'] == 'sell']
+        # 1回の走査で高値・安値・売買別の出来高と件数を集計
+        first = executions[0]['rate']
+        high = low = first
+        total = 0
+        buy_volume = sell_volume = 0
+        buy_count = sell_count = 0
+        for e in executions:
+            rate = e['rate']
+            total += rate
+            if rate > high:
+                high = rate
+            elif rate < low:
+                low = rate
+            order_type = e['order_type']
+            if order_type == 'buy':
+                buy_volume += e['amount']
+                buy_count += 1
+            elif order_type == 'sell':
+                sell_volume += e['amount']
+                sell_count += 1
         ohlcv = dotdict()
-        ohlcv.open = price[0]
-        ohlcv.high = max(price)
-        ohlcv.low = min(price)
-        ohlcv.close = price[-1]
-        ohlcv.buy_volume = sum(e['amount'] for e in buy)
-        ohlcv.sell_volume = sum(e['amount'] for e in sell)
+        ohlcv.open = first
+        ohlcv.high = high
+        ohlcv.low = low
+        ohlcv.close = executions[-1]['rate']
+        ohlcv.buy_volume = buy_volume
+        ohlcv.sell_volume = sell_volume
         ohlcv.volume = ohlcv.buy_volume + ohlcv.sell_volume
         ohlcv.volume_imbalance = ohlcv.buy_volume - ohlcv.sell_volume
-        ohlcv.buy_count = len(buy)
-        ohlcv.sell_count = len(sell)
+        ohlcv.buy_count = buy_count
+        ohlcv.sell_count = sell_count
         ohlcv.trades = ohlcv.buy_count + ohlcv.sell_count
         ohlcv.imbalance = ohlcv.buy_count - ohlcv.sell_count
-        ohlcv.average = sum(price) / len(price)
+        ohlcv.average = total / len(executions)
         return ohlcv
@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 import logging
 import asyncio
+import random
 from .utils import dotdict
 from .streaming import Streaming
 from .ohlcvbuilder import OHLCVBuilder
@@ -8,8 +9,24 @@ from .inventory import Inventory
 from .exchange import Exchange, ExchangeError
 from .board import Board
 from collections import deque, defaultdict
+from weakref import WeakValueDictionary
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 from time import time
+from operator import itemgetter
+
+# ログフォーマット
+_ORDER_FMT = '%(myid)s %(status)s %(order_type)s %(rate)s %(executed_amount)s/%(amount)s %(id)s'
+_NEW_FMT = 'NEW ' + _ORDER_FMT
+_CANCEL_FMT = 'CANCEL ' + _ORDER_FMT
+_CANCEL_LATER_FMT = 'CANCEL LATER ' + _ORDER_FMT
+_FORCED_CANCEL_FMT = 'FORCED CANCEL ' + _ORDER_FMT
+_OPEN_ORDER_FMT = '%(id)s %(order_type)s %(rate)s %(pair)s %(pending_amount)s'
+
+_trade_id = itemgetter('id')
+
+# 同じAPIキーのStrategy間でExchange（HTTPセッション）を共有
+_EXCHANGE_CACHE = WeakValueDictionary()
 
 class Strategy:
 
@@ -30,11 +47,13 @@ class Strategy:
 
         # OHLCV設定
         self.settings.max_ohlcv_size = 1000
+        self.settings.max_executions = 0
         self.settings.disable_rich_ohlcv = False
 
         # その他設定
         self.settings.enable_board = False
         self.settings.enable_board_api = False
+        self.settings.api_timeout = 5
 
         # ログ設定
         self.logger = logging.getLogger(__name__)
@@ -47,7 +66,10 @@ class Strategy:
         self.spec = Exchange.ProductSpecs[self.pair]
 
         # APIセットアップ
-        self.api = Exchange(self.settings.apiKey, self.settings.secret)
+        key = (self.settings.apiKey, self.settings.secret)
+        self.api = _EXCHANGE_CACHE.get(key)
+        if self.api is None:
+            self.api = _EXCHANGE_CACHE[key] = Exchange(*key)
 
         # ストリーム配信
         self.streaming = Streaming(Streaming.SocketioSource())
@@ -57,6 +79,8 @@ class Strategy:
         self.ohlcvbuilder = OHLCVBuilder(
             maxlen=self.settings.max_ohlcv_size,
             disable_rich_ohlcv=self.settings.disable_rich_ohlcv)
+        # OHLCV計算用スレッド（イベントループを塞がないよう1本で順に処理）
+        self._cpu_pool = ThreadPoolExecutor(max_workers=1)
 
         # 注文管理
         self.inventory = Inventory(self.spec)
@@ -67,18 +91,28 @@ class Strategy:
             self.board = Board(self.pair)
             ob = await self.api.orderbooks(self.pair)
             self.board.sync(ob)
+            self._last_sync_ts = asyncio.get_running_loop().time()
+            self._resync_task = None
             await self.board.attach(self.streaming)
         # 板情報（API）
         elif self.settings.enable_board_api:
             self.board = Board(self.pair)
 
         # ロジック実行
-        await asyncio.wait([
+        tasks = [asyncio.ensure_future(c) for c in (
             self.balance_polling(),
             self.cancel_nonactive_orders(),
             self.standard_logic(),
             self.inventory.start(),
-            self.streaming.start()])
+            self.streaming.start())]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            # 1つでも異常終了したら残りを止める
+            for t in tasks:
+                t.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self._cpu_pool.shutdown(wait=False)
 
     def get_order(self, myid):
         return self.inventory.get_order(myid)
@@ -87,9 +121,14 @@ class Strategy:
         # 注文がオープンならキャンセル
         o = self.inventory.get_order(myid)
         if o['status'] in Inventory.OPEN_STATUS:
-            if abs(o['rate']-limit)>limit_mask or abs(o['amount']-size)>0:
+            rate = o['rate']
+            if limit_mask:
+                rate_changed = abs(rate-limit)>limit_mask
+            else:
+                rate_changed = rate != limit
+            if rate_changed or o['amount'] != size:
                 try:
-                    self.logger.info('CANCEL {myid} {status} {order_type} {rate} {executed_amount}/{amount} {id}'.format(**o))
+                    self.logger.info(_CANCEL_FMT, o)
                     await self.api.cancel(o)
                 except ExchangeError as e:
                     self.logger.warning(type(e).__name__ + ": {0}".format(e))
@@ -102,7 +141,7 @@ class Strategy:
             res = await self.api.order(self.pair,side,size,limit)
             self.inventory.new_order(myid,res)
             o = self.inventory.get_order(myid)
-            self.logger.info('NEW {myid} {status} {order_type} {rate} {executed_amount}/{amount} {id}'.format(**o))
+            self.logger.info(_NEW_FMT, o)
             # 後でキャンセル
             if cancel_after_seconds is not None:
                 asyncio.ensure_future(self._cancel_later(o,cancel_after_seconds))
@@ -113,7 +152,7 @@ class Strategy:
         try:
             await asyncio.sleep(seconds)
             if o['status'] in Inventory.OPEN_STATUS:
-                self.logger.info('CANCEL LATER {myid} {status} {order_type} {rate} {executed_amount}/{amount} {id}'.format(**o))
+                self.logger.info(_CANCEL_LATER_FMT, o)
                 await self.api.cancel(o)
         except ExchangeError as e:
             self.logger.warning(type(e).__name__ + ": {0}".format(e))
@@ -125,7 +164,7 @@ class Strategy:
         o = self.inventory.get_order(myid)
         if o['status'] in Inventory.OPEN_STATUS:
             try:
-                self.logger.info('CANCEL {myid} {status} {order_type} {rate} {executed_amount}/{amount} {id}'.format(**o))
+                self.logger.info(_CANCEL_FMT, o)
                 await self.api.cancel(o)
             except ExchangeError as e:
                 self.logger.warning(type(e).__name__ + ": {0}".format(e))
@@ -133,63 +172,100 @@ class Strategy:
     async def cancel_order_all(self):
         pass
 
+    async def _resync_board(self):
+        try:
+            ob = await self.api.orderbooks(self.pair)
+            self.board.sync(ob)
+        except Exception as e:
+            self.logger.exception(e)
+
     async def check_balance(self):
         try:
-            ticker = await self.api.ticker(pair=self.pair)
-            balance = await self.api.balance()
+            pair = self.pair
+            api = self.api
+            timeout = self.settings.api_timeout
+            ticker = await asyncio.wait_for(api.ticker(pair=pair), timeout)
+            balance = await asyncio.wait_for(api.balance(), timeout)
             btc = balance['btc']+balance['btc_reserved']
             jpy = balance['jpy']+balance['jpy_reserved']
             total = int(jpy + ticker['bid']*btc)
             balance['jpy_total'] = total
             self.balance = dotdict(balance)
             self.logger.info(f'btc {btc:.8f} jpy {jpy:.0f} total {total}')
+            return True
         except ExchangeError as e:
             self.logger.warning(type(e).__name__ + ": {0}".format(e))
+        except asyncio.TimeoutError:
+            self.logger.warning('TimeoutError: ticker/balance in check_balance')
+        return False
 
     async def check_trades(self):
         try:
-            trades = await self.api.get_my_trades(end=self.latest_trade_id)
-            if len(trades):
-                self.latest_trade_id = max(t['id'] for t in trades)
+            # 降順ページングでending_beforeを指定すると、前回より新しい約定のみ取得される
+            trades = await asyncio.wait_for(
+                self.api.get_my_trades(end=self.latest_trade_id, order='desc'),
+                self.settings.api_timeout)
+            # APIの並び順は保証されないため最大IDを取る
+            self.latest_trade_id = max(map(_trade_id, trades), default=self.latest_trade_id)
             self.inventory.check_my_trades(trades)
         except ExchangeError as e:
             self.logger.warning(type(e).__name__ + ": {0}".format(e))
+        except asyncio.TimeoutError:
+            self.logger.warning('TimeoutError: get_my_trades in check_trades')
 
-    async def balance_polling(self):
+    async def balance_polling(self, base=300, cap=1200):
+        wait = base
         while True:
-            await asyncio.sleep(300)
+            # 待ち時間をばらつかせ、エラー時は指数的に延ばす
+            await asyncio.sleep(wait * random.uniform(0.8, 1.2))
+            failed = False
             try:
                 # 定期的に資産情報取得
-                await self.check_balance()
+                failed = not await self.check_balance()
             except Exception as e:
                 self.logger.exception(e)
+            wait = min(wait*2, cap) if failed else base
 
-    async def cancel_nonactive_orders(self):
+    async def cancel_nonactive_orders(self, base=15, cap=120):
+        wait = base
         while True:
-            await asyncio.sleep(15)
+            # 待ち時間をばらつかせ、エラー時は指数的に延ばす
+            await asyncio.sleep(wait * random.uniform(0.8, 1.2))
+            failed = False
             try:
                 # 最近の注文情報取得
                 recent_orders = self.inventory.get_nonactive_orders()
                 if len(recent_orders):
                     # 未決済の注文取得
                     open_orders = await self.api.get_orders()
-                    for o in open_orders:
-                        self.logger.info('{id} {order_type} {rate} {pair} {pending_amount}'.format(**o))
-                    open_orders = {o['id']:o for o in open_orders}
+                    open_ids = frozenset(o['id'] for o in open_orders)
                     # アクティブ注文を全てキャンセル
-                    cancel_needed = [o for o in recent_orders if o['id'] in open_orders]
+                    cancel_needed = [o for o in recent_orders if o['id'] in open_ids]
                     if len(cancel_needed):
-                        for o in cancel_needed:
-                            try:
-                                self.logger.info('FORCED CANCEL {myid} {status} {order_type} {rate} {executed_amount}/{amount} {id}'.format(**o))
-                                await self.api.cancel(o)
-                            except ExchangeError as e:
-                                self.logger.warning(type(e).__name__ + ": {0}".format(e))
+                        # キャンセル対象の注文のみ、1レコードにまとめてログ出力
+                        if self.logger.isEnabledFor(logging.INFO):
+                            cancel_ids = {o['id'] for o in cancel_needed}
+                            lines = [_OPEN_ORDER_FMT % o for o in open_orders if o['id'] in cancel_ids]
+                            lines += [_FORCED_CANCEL_FMT % o for o in cancel_needed]
+                            self.logger.info('%s', '\n'.join(lines))
+                        # 並列にキャンセル
+                        results = await asyncio.gather(
+                            *(self.api.cancel(o) for o in cancel_needed),
+                            return_exceptions=True)
+                        for o, res in zip(cancel_needed, results):
+                            if isinstance(res, ExchangeError):
+                                self.logger.warning(type(res).__name__ + ": {0}".format(res))
+                            elif isinstance(res, Exception):
+                                self.logger.exception(res, exc_info=res)
+                        # 約定済み等の個別の失敗では待ち時間を延ばさず、全件失敗した時のみ延ばす
+                        failed = all(isinstance(res, ExchangeError) for res in results)
 
             except ExchangeError as e:
                 self.logger.warning(type(e).__name__ + ": {0}".format(e))
+                failed = True
             except Exception as e:
                 self.logger.exception(e)
+            wait = min(wait*2, cap) if failed else base
 
     async def standard_logic(self):
         try:
@@ -197,53 +273,70 @@ class Strategy:
             await self.executions_ep.wait()
         except Exception as e:
             self.logger.exception(e)
+        # ループ内で使う属性をローカルに束縛
+        settings = self.settings
+        api = self.api
+        pair = self.pair
+        ep = self.executions_ep
+        builder = self.ohlcvbuilder
         last_entry_time = time()
+        loop = asyncio.get_running_loop()
+        next_t = None
         while True:
             try:
-                # 待ち
-                if self.settings.interval:
-                    await asyncio.sleep((-time() % self.settings.interval) or self.settings.interval)
+                # 待ち（モノトニック時計の期限で周期を固定）
+                interval = settings.interval
+                if interval:
+                    now = loop.time()
+                    if next_t is None or next_t < now:
+                        # 初回・処理遅延時は壁時計の区切りに合わせ直す
+                        next_t = now + ((-time() % interval) or interval)
+                    await asyncio.sleep(max(0, next_t - loop.time()))
+                    next_t += interval
                 else:
-                    await self.executions_ep.wait()
+                    next_t = None
+                    await ep.wait()
 
                 # 最小インターバル
-                if self.settings.minimum_interval:
-                    t1 = last_entry_time // self.settings.minimum_interval
-                    t2 = time() // self.settings.minimum_interval
+                if settings.minimum_interval:
+                    t1 = last_entry_time // settings.minimum_interval
+                    t2 = time() // settings.minimum_interval
                     can_entry = t2 > t1
                 else:
                     can_entry = True
 
                 # 注文情報更新
                 if can_entry:
-                    if self.settings.enable_board_api:
-                        ob = await self.api.orderbooks(self.pair)
+                    if settings.enable_board_api:
+                        ob = await api.orderbooks(pair)
                         self.board.sync(ob)
                     await self.check_trades()
 
                 # ポジション情報コピー
-                self.long_size = self.inventory.position.long_size
-                self.short_size = self.inventory.position.short_size
-                self.position_size = self.inventory.position.position_size
-                self.position_avg_price = self.inventory.position.position_avg_price
+                pos = self.inventory.position
+                self.long_size = pos.long_size
+                self.short_size = pos.short_size
+                self.position_size = pos.position_size
+                self.position_avg_price = pos.position_avg_price
 
                 # 約定履歴取得
-                executions = await self.executions_ep.get_data()
-                ohlcv = self.ohlcvbuilder.create_boundary_ohlcv(executions)
+                executions = await ep.get_data_drain(settings.max_executions)
+                ohlcv = await loop.run_in_executor(self._cpu_pool, builder.create_boundary_ohlcv, executions)
 
                 # ロジックコール
                 if can_entry:
                     last_entry_time = time()
-                    if self.settings.enable_board:
+                    if settings.enable_board:
                         board = self.board
-                        bids, asks = board.sort()
-                        bid, ask = bids[0]['price'], asks[0]['price']
+                        bid, ask = board.best_bid(), board.best_ask()
                         spread = ask - bid
-                        if spread<-50:
+                        resyncing = self._resync_task is not None and not self._resync_task.done()
+                        if spread<-50 and not resyncing and loop.time()-self._last_sync_ts>5:
                             self.logger.warning(f'orderbooks needs to be sync. spr {spread} bid {bid} ask {ask}')
-                            ob = await self.api.orderbooks(self.pair)
-                            board.sync(ob)
-                    elif self.settings.enable_board_api:
+                            # 再同期はバックグラウンドで行い、実行中・5秒以内の再要求は抑止
+                            self._last_sync_ts = loop.time()
+                            self._resync_task = asyncio.ensure_future(self._resync_board())
+                    elif settings.enable_board_api:
                         board = self.board
                     else:
                         board = None
@@ -71,7 +71,7 @@ class Streaming:
         if self.running == False:
             self.running = True
             self.logger.info('Start Streaming')
-            await asyncio.wait([self.source.start(self._on_data,self._on_connect,self.logger)])
+            await self.source.start(self._on_data,self._on_connect,self.logger)
             self.logger.info('Stop Streaming')
 
     async def stop(self):
@@ -274,9 +274,13 @@ class Streaming:
 
         def __init__(self, maxlen=100):
             super().__init__()
+            self.logger = logging.getLogger(__name__)
             self.deq = deque(maxlen=maxlen)
+            self.overflow_count = 0
 
         def update(self, channel, data):
+            if len(self.deq) == self.deq.maxlen:
+                self.overflow_count += 1
             self.deq.append(data)
             return True
 
@@ -285,6 +289,20 @@ class Streaming:
             self.deq.clear()
             return data
 
+        async def get_data_drain(self, max_keep=0):
+            # 溜まったデータを全て取り出し、新しい方からmax_keep件だけ返す
+            async with self.cond:
+                data = self.fetch_data()
+                dropped = self.overflow_count
+                self.overflow_count = 0
+                self.updated = False
+            if max_keep and len(data) > max_keep:
+                dropped += len(data) - max_keep
+                data = data[-max_keep:]
+            if dropped:
+                self.logger.info('Drop %d stale items', dropped)
+            return data
+
 if __name__ == "__main__":
     import argparse
 
@@ -306,6 +324,6 @@ if __name__ == "__main__":
                     # print(ob)
                 except Exception as e:
                     print(e)
-        await asyncio.wait([streaming.start(),poll()])
+        await asyncio.gather(streaming.start(),poll())
 
-    asyncio.get_event_loop().run_until_complete(asyncio.wait([public_main()]))
+    asyncio.get_event_loop().run_until_complete(public_main())
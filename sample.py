@@ -22,4 +22,4 @@ if __name__ == "__main__":
     strategy.settings.secret = settings.secret
 
     loop = asyncio.get_event_loop()
-    loop.run_until_complete(asyncio.wait([strategy.start()]))
+    loop.run_until_complete(strategy.start())